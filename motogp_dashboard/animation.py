@@ -3,20 +3,61 @@ import matplotlib.animation as mpl_animation
 from motogp_dashboard import config
 from motogp_dashboard import utils
 
-def run_animation(fig, animate, n_frames, df):
+class Playhead:
+    """Shared playback position, lets the timeline seek a running animation."""
+
+    def __init__(self):
+        self._seek_t = None
+
+    def seek(self, t_s):
+        self._seek_t = float(t_s)
+
+    def take_seek(self):
+        t_s, self._seek_t = self._seek_t, None
+        return t_s
+
+def playback_frames(latest, playhead = None):
+    # Yields (session, i), switching to newer data whenever the loader publishes it
+    session, done = latest()
+    df = session.to_frame()
+    i = 0
+    while True:
+        new_session, done = latest()
+        if new_session is not session:
+            # Keep the playhead on the same session time in the new frame
+            t_now = float(df['time_s'].iloc[i])
+            session = new_session
+            df = session.to_frame()
+            i = min(int(np.searchsorted(df['time_s'].to_numpy(), t_now)), len(df) - 1)
+
+        if playhead is not None:
+            t_seek = playhead.take_seek()
+            if t_seek is not None:
+                i = min(int(np.searchsorted(df['time_s'].to_numpy(), t_seek)), len(df) - 1)
+
+        yield session, i
+
+        if i < len(df) - 1:
+            i += 1
+        elif done and playhead is None:
+            return
+
+def run_playback(fig, animate, latest, playhead = None):
     # Determine interval from median dt to get real time animation
-    interval_ms = int(1000 * df['dt'].median())
+    session, _ = latest()
+    interval_ms = int(1000 * session.to_frame()['dt'].median())
     ani = mpl_animation.FuncAnimation(
-        fig, animate, frames = n_frames,
-        interval = interval_ms, blit = True, repeat = False
+        fig, animate, frames = playback_frames(latest, playhead),
+        interval = interval_ms, blit = True, repeat = False,
+        cache_frame_data = False
     )
     return ani
 
-def make_animate(df, x, y, dot,
+def make_animate(dot,
                  left_fill, right_fill, lean_text,
                  brk_rect, thr_rect, speed_text, gear_text,
                  lap_text, laptime_text,
-                 bars_geo):
+                 bars_geo, timeline = None):
     # builds animation function
     max_deg = float(config.MAX_DEG)
 
@@ -91,22 +132,28 @@ def make_animate(df, x, y, dot,
         thr_rect.set_width(thr_w)
         thr_rect.set_height(bar_h)
 
-    def animate(i):
+    def animate(frame):
+        # Playback passes (session, i) so the data can grow mid-run
+        session, i = frame
+        frame_df = session.to_frame()
+        if timeline is not None:
+            timeline.set_session(session)
+
         # Track position
-        dot.set_data([x.iloc[i]], [y.iloc[i]])
+        dot.set_data([frame_df['world_position_X'].iloc[i]], [frame_df['world_position_Y'].iloc[i]])
 
         # Readouts
-        throttle = df['throttle_smooth'].iloc[i]
-        brake = df['brake_smooth'].iloc[i]
-        speed_kph = int(df['speed_kph'].iloc[i])
-        gear = int(df['gear'].iloc[i])
+        throttle = frame_df['throttle_smooth'].iloc[i]
+        brake = frame_df['brake_smooth'].iloc[i]
+        speed_kph = int(frame_df['speed_kph'].iloc[i])
+        gear = int(frame_df['gear'].iloc[i])
 
         # Lean angle
-        lean_ang = df['lean_deg_signed'].iloc[i]
+        lean_ang = frame_df['lean_deg_signed'].iloc[i]
 
         # Lap and live lap time
-        lap_val = int(df['lapIndex'].iloc[i])
-        t_s = float(df['lap_time_s'].iloc[i])
+        lap_val = int(frame_df['lapIndex'].iloc[i])
+        t_s = float(frame_df['lap_time_s'].iloc[i])
         lap_text.set_text(f"Lap {lap_val}")
         laptime_text.set_text(utils.format_time(t_s))
 
@@ -115,10 +162,14 @@ def make_animate(df, x, y, dot,
         speed_text.set_text(f"{speed_kph}km/h")
         gear_text.set_text(f"{gear}")
 
-        return (
+        artists = (
             dot, brk_rect, thr_rect,
             left_fill, right_fill, lean_text,
             speed_text, gear_text, lap_text, laptime_text
         )
+        if timeline is not None:
+            timeline.set_playhead(float(frame_df['time_s'].iloc[i]))
+            artists += (timeline.cursor,)
+        return artists
 
     return animate
@@ -7,6 +7,14 @@ DATA_DIR  = 'data'
 FILENAME  = 'new_example.csv'
 CSV_PATH  = os.path.join(DATA_DIR, FILENAME)
 
+# ----------------------------
+# Startup
+# ----------------------------
+PROGRESSIVE_LOAD    = True   # show the window and start on the first lap while the rest loads
+LOAD_CHUNK_ROWS     = 20000
+LOAD_PUBLISH_GROWTH = 2.0   # after the first lap, republish once the loaded rows grow by this factor
+LOAD_POLL_MS        = 50
+
 # ----------------------------
 # Cleaning parameters
 # ----------------------------
@@ -31,6 +39,18 @@ DT_PER_TICK = 0.01
 MIN_DT      = 0.01
 MAX_DT      = 0.20
 
+# ----------------------------
+# Streaming server
+# ----------------------------
+STREAM_HOST         = '127.0.0.1'
+STREAM_PORT         = 8765
+STREAM_FPS          = 30
+STREAM_CLOCK        = 'main'       # broadcast clock used when the URL names none
+STREAM_IN_FLIGHT    = 2            # unacknowledged frames per client before newer ones replace them
+STREAM_SEND_BUFFER  = 256          # kernel send buffer per client, about one frame (the OS may round up)
+STREAM_MAX_RATE     = 8.0          # playback rate limit for clock controls
+STREAM_TRACK_POINTS = 2000
+
 # ----------------------------
 # Figure / track
 # ----------------------------
@@ -39,6 +59,7 @@ TRACK_COLOR     = (0.20, 0.20, 0.20)
 TRACK_ALPHA     = 0.25
 TRACK_LINEWIDTH = 1.2
 SUBPLOT_BOTTOM  = 0.44 # Reserve space for the track map
+REFERENCE_LAP   = 1    # lap drawn as the track underlay
 
 # Start/Fin flag
 SF_LEN_REL           = 0.070
@@ -105,6 +126,20 @@ FONT_WEIGHT     = 'normal'
 STROKE_W        = 1.0
 STROKE_ALPHA    = 0.85
 
+# ----------------------------
+# Timeline strip
+# ----------------------------
+# [left, bottom, width, height], sits under the HUD
+TIMELINE_AX_POS       = [0.07, 0.035, 0.86, 0.07]
+TIMELINE_LINEWIDTH    = 0.8
+TIMELINE_LANE_PAD     = 0.12    # gap between channel lanes, fraction of a lane
+TIMELINE_SPEED_COLOR  = (0.20, 0.20, 0.20)
+TIMELINE_LEAN_COLOR   = (0.85, 0.55, 0.05)
+TIMELINE_CURSOR_COLOR = 'red'
+TIMELINE_FONT_SIZE    = 7
+TIMELINE_ZOOM_STEP    = 1.25
+TIMELINE_MIN_SPAN_S   = 2.0
+
 # Colors
 DOT_COLOR      = 'red'
 THROTTLE_COLOR = 'green'
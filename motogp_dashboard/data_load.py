@@ -1,12 +1,11 @@
+import threading
 import pandas as pd
 import numpy as np
 from motogp_dashboard import config
+from motogp_dashboard import utils
 
-def add_lean_angle(df):
-    # Calculate lean angle (degrees) from telemetry world positions
-    x = df['world_position_X'].astype('float64').to_numpy()
-    y = df['world_position_Y'].astype('float64').to_numpy()
-    t = df['time_s'].astype('float64').to_numpy()
+def lean_angle(x, y, t, speed, pos_smooth_s, lean_smooth_s, min_speed_ms, max_deg):
+    # Calculate lean angle (degrees) from world positions, returns a numpy array
 
     # enforce monotonically increasing time
     t = t + np.arange(len(t)) * 1e-9
@@ -16,7 +15,7 @@ def add_lean_angle(df):
     dt_med = float(med) if np.isfinite(med) and med > 0 else 1.0 / 60.0
 
     # smoothing on positions
-    w_pos = int(round(config.POS_SMOOTH_S / dt_med))
+    w_pos = int(round(pos_smooth_s / dt_med))
     if w_pos < 5: w_pos = 5
     if w_pos % 2 == 0: w_pos += 1
 
@@ -35,75 +34,344 @@ def add_lean_angle(df):
     kappa = (dx * ddy - dy * ddx) / denom
     kappa = np.nan_to_num(kappa, nan = 0.0, posinf = 0.0, neginf = 0.0)
 
-    speed = df['speed_mps'].astype('float64').to_numpy()
-
     a_lat = (speed ** 2) * kappa
     phi_rad = np.arctan2(a_lat, 9.81)
     lean_deg = np.degrees(phi_rad)
 
     # Clean up nans, low speed and clip
-    lean_deg[speed < float(config.MIN_SPEED_MS)] = 0.0
-    lean_deg = np.clip(lean_deg, -float(config.MAX_DEG), float(config.MAX_DEG))
+    lean_deg[speed < float(min_speed_ms)] = 0.0
+    lean_deg = np.clip(lean_deg, -float(max_deg), float(max_deg))
     lean_deg = np.nan_to_num(lean_deg, nan = 0.0, posinf = 0.0, neginf = 0.0)
 
     # final smoothing
-    w_lean = int(round(config.LEAN_SMOOTH_S / dt_med))
+    w_lean = int(round(lean_smooth_s / dt_med))
     if w_lean < 7: w_lean = 7
     if w_lean % 2 == 0: w_lean += 1
 
     lean_deg = pd.Series(lean_deg).rolling(window = 5, center = True, min_periods = 1).median() \
                                  .rolling(window = w_lean, center = True, min_periods = 1).mean().to_numpy()
+    return lean_deg
 
-    df['lean_deg_signed'] = lean_deg
-    df['lean_deg'] = np.abs(lean_deg)
-    return df
+def calc_speed(df):
+    # Speed (m/s) from the velocity vector
+    vx = df['velocity_X']; vy = df['velocity_Y']; vz = df['velocity_Z']
+    return np.sqrt(vx**2 + vy**2 + vz**2)
+
+def lap_time(lap_index, dt):
+    # Live lap time, restarts at zero on every new lap
+    return dt.groupby(lap_index).cumsum().shift(fill_value = 0.0)
+
+def clean_data(df):
+    # Inputs
+    df['throttle'] = df['throttle'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(0, 1)
+    df['brake_0'] = df['brake_0'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(0, 1)
+    # RPM kept for possible future use
+    df['rpm'] = df['rpm'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(lower = 0)
+
+    df['gear'] = df['gear'].replace(-1, np.nan).ffill().bfill().round().clip(1, 6).astype(int)
+
+    df['world_position_X'] = df['world_position_X'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both')
+    df['world_position_Y'] = df['world_position_Y'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both')
+
+    df = df.dropna(subset = ['world_position_X', 'world_position_Y', 'throttle', 'brake_0', 'rpm', 'gear']).reset_index(drop = True)
 
-def add_lap_time(df):
+    # Remove GPS jumps
+    dx = df['world_position_X'].diff()
+    dy = df['world_position_Y'].diff()
+    distance = (dx**2 + dy**2) ** 0.5
+    jump_threshold = distance.mean() + config.JUMP_SIGMA * distance.std()
+    df = df[distance.fillna(0) < jump_threshold].reset_index(drop = True)
+
+    # Timing
+    bin_index_diff = df['binIndex'].diff()
+    df['dt_raw'] = (bin_index_diff.fillna(1) * config.DT_PER_TICK).clip(lower = 0)
+    df['dt'] = df['dt_raw'].clip(lower = config.MIN_DT, upper = config.MAX_DT)
+    df['time_s'] = df['dt_raw'].cumsum()
+
+    # Laps
     df['lapIndex'] = df['lapIndex'].round().astype('Int64').ffill().bfill().astype(int)
-    df['lap_time_s'] = df.groupby('lapIndex')['dt'].cumsum().shift(fill_value = 0.0)
+
     return df
 
-def load_data():
+def read_data(on_chunk = None, chunk_rows = None):
+    # Read and clean only, derived channels are left to the caller.
+    # With on_chunk the CSV is read in chunks and on_chunk(chunks) is called
+    # with the chunks read so far after each one.
     try:
-        df = pd.read_csv(config.CSV_PATH, sep = "\t")
+        if on_chunk is None:
+            df = pd.read_csv(config.CSV_PATH, sep = "\t")
+        else:
+            chunks = []
+            for chunk in pd.read_csv(config.CSV_PATH, sep = "\t", chunksize = chunk_rows):
+                chunks.append(chunk)
+                on_chunk(chunks)
+            df = pd.concat(chunks, ignore_index = True)
         print(f"Loaded {len(df)} rows from '{config.FILENAME}'")
+        return clean_data(df)
+
+    except Exception as e:
+        print(f"Failed to load or clean CSV: {e}")
+        return None
+
+def default_params():
+    # Tunable parameters of the derived channels, taken from config
+    return {
+        'pos_smooth_s'    : config.POS_SMOOTH_S,
+        'lean_smooth_s'   : config.LEAN_SMOOTH_S,
+        'min_speed_ms'    : config.MIN_SPEED_MS,
+        'max_deg'         : config.MAX_DEG,
+        'smoothing_alpha' : config.SMOOTHING_ALPHA,
+        'thr_rate_up'     : config.THR_RATE_UP,
+        'thr_rate_down'   : config.THR_RATE_DOWN,
+        'brk_rate_up'     : config.BRK_RATE_UP,
+        'brk_rate_down'   : config.BRK_RATE_DOWN,
+    }
+
+class TelemetrySession:
+    """Cleaned telemetry with lazily computed derived channels.
+
+    Each channel is computed the first time one of its columns is accessed
+    and memoized. Changing a parameter with set_params drops the channels
+    that read it, along with everything that depends on them.
+    """
+
+    # channel -> (columns, channels it needs, params it reads)
+    CHANNELS = {
+        'speed'           : (('speed_mps', 'speed_kph'), (), ()),
+        'lean'            : (('lean_deg_signed', 'lean_deg'), ('speed',),
+                             ('pos_smooth_s', 'lean_smooth_s', 'min_speed_ms', 'max_deg')),
+        'lap_time'        : (('lap_time_s',), (), ()),
+        'throttle_smooth' : (('throttle_smooth',), (), ('smoothing_alpha', 'thr_rate_up', 'thr_rate_down')),
+        'brake_smooth'    : (('brake_smooth',), (), ('smoothing_alpha', 'brk_rate_up', 'brk_rate_down')),
+        'frame'           : ((), ('speed', 'lean', 'lap_time', 'throttle_smooth', 'brake_smooth'), ()),
+        'pyramids'        : ((), ('speed', 'lean', 'throttle_smooth', 'brake_smooth'), ()),
+    }
+
+    # Columns the timeline draws from a min/max pyramid
+    PYRAMID_COLUMNS = ('speed_kph', 'throttle_smooth', 'brake_smooth', 'lean_deg_signed')
+
+    def __init__(self, df, **params):
+        self.df = df
+        self.params = default_params()
+        self._cache = {}
+        self.set_params(**params)
+
+    def set_params(self, **params):
+        unknown = set(params) - set(self.params)
+        if unknown:
+            raise KeyError(f"Unknown session parameter(s): {', '.join(sorted(unknown))}")
+
+        for key, value in params.items():
+            if self.params[key] == value:
+                continue
+            self.params[key] = value
+            for name, (_, _, reads) in self.CHANNELS.items():
+                if key in reads:
+                    self.invalidate(name)
+
+    def invalidate(self, name):
+        # Drop a channel and every channel built on top of it
+        self._cache.pop(name, None)
+        for other, (_, needs, _) in self.CHANNELS.items():
+            if name in needs and other in self._cache:
+                self.invalidate(other)
+
+    def channel(self, name):
+        if name not in self._cache:
+            _, needs, _ = self.CHANNELS[name]
+            for dep in needs:
+                self.channel(dep)
+            self._cache[name] = getattr(self, '_compute_' + name)()
+        return self._cache[name]
+
+    def is_computed(self, name):
+        return name in self._cache
+
+    # Channel computations
+    def _compute_speed(self):
+        speed_mps = calc_speed(self.df)
+        return {'speed_mps': speed_mps, 'speed_kph': speed_mps * 3.6}
 
-        # Inputs
-        df['throttle'] = df['throttle'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(0, 1)
-        df['brake_0'] = df['brake_0'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(0, 1)
-        # RPM kept for possible future use
-        df['rpm'] = df['rpm'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both').clip(lower = 0)
+    def _compute_lean(self):
+        p = self.params
+        lean_deg = lean_angle(
+            self.df['world_position_X'].astype('float64').to_numpy(),
+            self.df['world_position_Y'].astype('float64').to_numpy(),
+            self.df['time_s'].astype('float64').to_numpy(),
+            self.speed_mps.astype('float64').to_numpy(),
+            pos_smooth_s = p['pos_smooth_s'], lean_smooth_s = p['lean_smooth_s'],
+            min_speed_ms = p['min_speed_ms'], max_deg = p['max_deg']
+        )
+        return {
+            'lean_deg_signed': pd.Series(lean_deg, index = self.df.index),
+            'lean_deg': pd.Series(np.abs(lean_deg), index = self.df.index)
+        }
 
-        df['gear'] = df['gear'].replace(-1, np.nan).ffill().bfill().round().clip(1, 6).astype(int)
+    def _compute_lap_time(self):
+        return {'lap_time_s': lap_time(self.df['lapIndex'], self.df['dt'])}
 
-        df['world_position_X'] = df['world_position_X'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both')
-        df['world_position_Y'] = df['world_position_Y'].replace(-1.0, np.nan).interpolate(limit = config.INTERPOLATE_LIMIT, limit_direction = 'both')
+    def _smoothed(self, column, rate_up, rate_down):
+        out = utils.smooth_and_limit(
+            self.df[column], self.df['dt'],
+            alpha = self.params['smoothing_alpha'],
+            rate_up = self.params[rate_up], rate_down = self.params[rate_down]
+        )
+        return pd.Series(out, index = self.df.index)
 
-        df = df.dropna(subset = ['world_position_X', 'world_position_Y', 'throttle', 'brake_0', 'rpm', 'gear']).reset_index(drop = True)
+    def _compute_throttle_smooth(self):
+        return {'throttle_smooth': self._smoothed('throttle', 'thr_rate_up', 'thr_rate_down')}
 
-        # Remove GPS jumps
-        dx = df['world_position_X'].diff()
-        dy = df['world_position_Y'].diff()
-        distance = (dx**2 + dy**2) ** 0.5
-        jump_threshold = distance.mean() + config.JUMP_SIGMA * distance.std()
-        df = df[distance.fillna(0) < jump_threshold].reset_index(drop = True)
+    def _compute_brake_smooth(self):
+        return {'brake_smooth': self._smoothed('brake_0', 'brk_rate_up', 'brk_rate_down')}
 
-        # Timing
-        bin_index_diff = df['binIndex'].diff()
-        df['dt_raw'] = (bin_index_diff.fillna(1) * config.DT_PER_TICK).clip(lower = 0)
-        df['dt'] = df['dt_raw'].clip(lower = config.MIN_DT, upper = config.MAX_DT)
-        df['time_s'] = df['dt_raw'].cumsum()
+    def _compute_frame(self):
+        # Everything the dashboard plays back, as one DataFrame
+        frame = self.df.copy()
+        for name, (columns, _, _) in self.CHANNELS.items():
+            for col in columns:
+                frame[col] = self.channel(name)[col]
+        return frame
 
-        # Speed
-        vx = df['velocity_X']; vy = df['velocity_Y']; vz = df['velocity_Z']
-        df['speed_mps'] = np.sqrt(vx**2 + vy**2 + vz**2)
-        df['speed_kph'] = df['speed_mps'] * 3.6
+    def _compute_pyramids(self):
+        return {col: utils.MinMaxPyramid(getattr(self, col)) for col in self.PYRAMID_COLUMNS}
 
-        df = add_lean_angle(df)
-        df = add_lap_time(df)
+    # Derived columns
+    @property
+    def speed_mps(self):
+        return self.channel('speed')['speed_mps']
 
+    @property
+    def speed_kph(self):
+        return self.channel('speed')['speed_kph']
+
+    @property
+    def lean_deg_signed(self):
+        return self.channel('lean')['lean_deg_signed']
+
+    @property
+    def lean_deg(self):
+        return self.channel('lean')['lean_deg']
+
+    @property
+    def lap_time_s(self):
+        return self.channel('lap_time')['lap_time_s']
+
+    @property
+    def throttle_smooth(self):
+        return self.channel('throttle_smooth')['throttle_smooth']
+
+    @property
+    def brake_smooth(self):
+        return self.channel('brake_smooth')['brake_smooth']
+
+    @property
+    def pyramids(self):
+        return self.channel('pyramids')
+
+    def to_frame(self):
+        return self.channel('frame')
+
+def load_session(**params):
+    df = read_data()
+    if df is None:
+        return None
+    return TelemetrySession(df, **params)
+
+def load_data():
+    # Cleaned frame with speed, lean and lap time, without the smoothed inputs
+    session = load_session()
+    if session is None:
+        return None
+
+    try:
+        df = session.df.copy()
+        for name in ('speed', 'lean', 'lap_time'):
+            for col, values in session.channel(name).items():
+                df[col] = values
         return df
 
     except Exception as e:
         print(f"Failed to load or clean CSV: {e}")
         return None
+
+def first_lap_end(df):
+    # Row where the first complete lap ends, None if it has not ended yet
+    lap = df['lapIndex'].round().dropna()
+    if lap.empty:
+        return None
+    # The head must also contain the reference lap, the underlay is drawn from it
+    base = max(lap.iloc[0], config.REFERENCE_LAP)
+    after = lap[lap > base]
+    if after.empty:
+        return None
+    return int(df.index.get_loc(after.index[0]))
+
+class ProgressiveLoader:
+    """Loads the session on a background thread, first lap first.
+
+    The first lap is cleaned and published as soon as its rows have been
+    read. After that the loaded prefix is republished whenever it has grown
+    by LOAD_PUBLISH_GROWTH, and finally the whole session. Growing
+    geometrically keeps the total work within a small factor of a serial
+    load. latest() returns the newest TelemetrySession and whether loading
+    has finished.
+    """
+
+    def __init__(self, chunk_rows = None, growth = None, **params):
+        self.chunk_rows = int(chunk_rows or config.LOAD_CHUNK_ROWS)
+        self.growth = max(1.0, float(growth or config.LOAD_PUBLISH_GROWTH))
+        self.params = params
+        self.failed = False
+        self._lock = threading.Lock()
+        self._session = None
+        self._done = False
+        self._published_rows = None
+        self._thread = threading.Thread(target = self._run, daemon = True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def latest(self):
+        with self._lock:
+            return self._session, self._done
+
+    def _publish(self, df, done):
+        session = TelemetrySession(df, **self.params)
+        # Do the heavy work here rather than on the GUI thread
+        session.to_frame()
+        session.channel('pyramids')
+        with self._lock:
+            self._session = session
+            self._done = done
+
+    def _on_chunk(self, chunks):
+        if self._published_rows is None:
+            raw = pd.concat(chunks, ignore_index = True)
+            end = first_lap_end(raw)
+            if end is not None:
+                self._publish(clean_data(raw.iloc[:end].copy()), done = False)
+                print(f"First lap ready ({end} rows), loading the rest")
+                self._published_rows = end
+            return
+
+        # Fill in behind the playhead, one geometrically growing prefix at a time
+        n_rows = sum(len(c) for c in chunks)
+        if n_rows >= self.growth * self._published_rows:
+            self._publish(clean_data(pd.concat(chunks, ignore_index = True)), done = False)
+            self._published_rows = n_rows
+
+    def _run(self):
+        # read_data reports its own failures
+        df = read_data(on_chunk = self._on_chunk, chunk_rows = self.chunk_rows)
+        if df is not None:
+            try:
+                self._publish(df, done = True)
+                return
+            except Exception as e:
+                print(f"Failed to load or clean CSV: {e}")
+
+        self.failed = True
+        # Let playback finish whatever was already published
+        with self._lock:
+            self._done = True
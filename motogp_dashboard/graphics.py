@@ -18,18 +18,10 @@ def stroke_effect():
     rgba_black = (0.0, 0.0, 0.0, float(config.STROKE_ALPHA))
     return [pe.withStroke(linewidth = float(config.STROKE_W), foreground = rgba_black)]
 
-def init_plot(x, y):
+def init_figure():
     fig, ax = plt.subplots(figsize = config.TRACK_SIZE)
     fig.subplots_adjust(bottom = config.SUBPLOT_BOTTOM)
 
-    ax.plot(
-        x, y,
-        color = config.TRACK_COLOR,
-        zorder = 0,
-        linewidth = config.TRACK_LINEWIDTH,
-        alpha = config.TRACK_ALPHA
-    )
-
     dot, = ax.plot([], [], 'o', color = config.DOT_COLOR, markersize = 10, zorder = 2)
 
     fig.patch.set_facecolor('white')
@@ -42,6 +34,20 @@ def init_plot(x, y):
 
     return fig, ax, dot
 
+def draw_track(ax, x, y):
+    ax.plot(
+        x, y,
+        color = config.TRACK_COLOR,
+        zorder = 0,
+        linewidth = config.TRACK_LINEWIDTH,
+        alpha = config.TRACK_ALPHA
+    )
+
+def init_plot(x, y):
+    fig, ax, dot = init_figure()
+    draw_track(ax, x, y)
+    return fig, ax, dot
+
 def draw_start_finish(ax, x, y):
     xs = x.to_numpy()
     ys = y.to_numpy()
@@ -88,12 +94,12 @@ def draw_start_finish(ax, x, y):
         zorder = 4
     )
 
-def setup_underlay(df, x, y):
-    base_mask = (df['lapIndex'] == 1)
+def draw_underlay(ax, dot, df, x, y):
+    base_mask = (df['lapIndex'] == config.REFERENCE_LAP)
     x_base = x[base_mask]
     y_base = y[base_mask]
 
-    fig, ax, dot = init_plot(x_base, y_base)
+    draw_track(ax, x_base, y_base)
 
     for ln in list(ax.lines):
         if ln is not dot:
@@ -103,6 +109,9 @@ def setup_underlay(df, x, y):
 
     draw_start_finish(ax, x_base, y_base)
 
+def setup_underlay(df, x, y):
+    fig, ax, dot = init_figure()
+    draw_underlay(ax, dot, df, x, y)
     return fig, ax, dot
 
 # Simple rounded HUD background
@@ -3,30 +3,70 @@ import matplotlib.pyplot as plt
 from motogp_dashboard import data_load
 from motogp_dashboard import graphics
 from motogp_dashboard import animation
-from motogp_dashboard import utils
+from motogp_dashboard import timeline
 from motogp_dashboard import config
 
+def main_progressive():
+    # Window and HUD come up straight away, playback starts on the first lap
+    loader = data_load.ProgressiveLoader().start()
+
+    fig, ax, dot = graphics.init_figure()
+    (
+        left_fill, right_fill, lean_text,
+        brk_rect, thr_rect, speed_text, gear_text,
+        lap_text, laptime_text,
+        bars_geo
+    ) = graphics.hud(fig, ax)
+
+    # Timeline strip
+    playhead = animation.Playhead()
+    strip = timeline.TimelineStrip(fig, playhead)
+
+    animate = animation.make_animate(
+        dot,
+        left_fill, right_fill, lean_text,
+        brk_rect, thr_rect, speed_text, gear_text,
+        lap_text, laptime_text,
+        bars_geo, timeline = strip
+    )
+
+    state = {}
+    timer = fig.canvas.new_timer(interval = config.LOAD_POLL_MS)
+
+    def poll():
+        if loader.failed and loader.latest()[0] is None:
+            timer.stop()
+            plt.close(fig)
+            return
+        session, _ = loader.latest()
+        if session is None:
+            return
+        timer.stop()
+
+        df = session.to_frame()
+        graphics.draw_underlay(ax, dot, df, df['world_position_X'], df['world_position_Y'])
+        strip.set_session(session)
+        state['ani'] = animation.run_playback(fig, animate, loader.latest, playhead)
+        strip.animation = state['ani']
+        fig.canvas.draw_idle()
+
+    timer.add_callback(poll)
+    timer.start()
+    plt.show()
+
 def main():
-    # Load and clean telemetry
-    df = data_load.load_data()
-    if df is None:
+    if config.PROGRESSIVE_LOAD:
+        return main_progressive()
+
+    # Load and clean telemetry, derived channels are computed on first use
+    session = data_load.load_session()
+    if session is None:
         return
+    df = session.to_frame()
 
     x = df['world_position_X']
     y = df['world_position_Y']
 
-    # Smoothed break and throttle
-    df['throttle_smooth'] = utils.smooth_and_limit(
-        df['throttle'], df['dt'],
-        alpha = config.SMOOTHING_ALPHA,
-        rate_up = config.THR_RATE_UP, rate_down = config.THR_RATE_DOWN
-    )
-    df['brake_smooth'] = utils.smooth_and_limit(
-        df['brake_0'], df['dt'],
-        alpha = config.SMOOTHING_ALPHA,
-        rate_up = config.BRK_RATE_UP, rate_down = config.BRK_RATE_DOWN
-    )
-
     # Figure
     fig_ax = graphics.setup_underlay(df, x, y)
     if fig_ax is None:
@@ -42,16 +82,21 @@ def main():
         bars_geo
     ) = graphics.hud(fig, ax)
 
+    # Timeline strip
+    playhead = animation.Playhead()
+    strip = timeline.TimelineStrip(fig, playhead)
+    strip.set_session(session)
+
     # Animation
     animate = animation.make_animate(
-        df, x, y, dot,
+        dot,
         left_fill, right_fill, lean_text,
         brk_rect, thr_rect, speed_text, gear_text,
         lap_text, laptime_text,
-        bars_geo
+        bars_geo, timeline = strip
     )
-    n_frames = len(df)
-    _ = animation.run_animation(fig, animate, n_frames, df)
+    ani = animation.run_playback(fig, animate, lambda: (session, True), playhead)
+    strip.animation = ani
 
     plt.show()
 
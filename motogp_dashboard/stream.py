@@ -0,0 +1,428 @@
+import asyncio
+import base64
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import struct
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+from motogp_dashboard import config
+from motogp_dashboard import data_load
+
+# Per-frame HUD state, the same readouts animate() draws
+# (name, column, scale) values are sent as round(column * scale)
+HUD_FIELDS = (
+    ('x',        'world_position_X', 100),
+    ('y',        'world_position_Y', 100),
+    ('speed',    'speed_kph',        10),
+    ('gear',     'gear',             1),
+    ('lean',     'lean_deg_signed',  10),
+    ('throttle', 'throttle_smooth',  1000),
+    ('brake',    'brake_smooth',     1000),
+    ('lap',      'lapIndex',         1),
+    ('lap_time', 'lap_time_s',       1000),
+)
+
+KIND_KEY   = 0
+KIND_DELTA = 1
+HEADER     = struct.Struct('<BIH')   # kind, frame index, changed field mask
+
+WS_GUID     = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT     = 0x1
+OP_BINARY   = 0x2
+OP_CLOSE    = 0x8
+OP_PING     = 0x9
+OP_PONG     = 0xA
+MAX_INBOUND = 64 * 1024
+
+CLIENT_HTML = os.path.join(os.path.dirname(__file__), 'web', 'index.html')
+
+# ----------------------------
+# Frame encoding
+# ----------------------------
+def quantize(df):
+    # All frames as one int64 matrix, one column per HUD field
+    cols = [np.rint(df[col].astype('float64').to_numpy() * scale) for _, col, scale in HUD_FIELDS]
+    return np.column_stack(cols).astype(np.int64)
+
+def varint(n):
+    # Zigzag then LEB128, small deltas of either sign take one byte
+    n = 2 * n if n >= 0 else -2 * n - 1
+    out = bytearray()
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def encode_frame(index, row, prev = None):
+    # Keyframe if there is nothing to diff against, otherwise only the changed fields
+    if prev is None:
+        kind, mask, values = KIND_KEY, (1 << len(row)) - 1, row
+    else:
+        diff = row - prev
+        kind, mask, values = KIND_DELTA, 0, []
+        for k, d in enumerate(diff):
+            if d:
+                mask |= 1 << k
+                values.append(d)
+
+    payload = bytearray(HEADER.pack(kind, index, mask))
+    for v in values:
+        payload += varint(int(v))
+    return bytes(payload)
+
+def session_info(df, clock_name):
+    # Sent once per client as JSON, everything the page needs besides frames
+    base = df[df['lapIndex'] == config.REFERENCE_LAP]
+    if base.empty:
+        base = df
+    step = max(1, int(np.ceil(len(base) / float(config.STREAM_TRACK_POINTS))))
+    track = base[['world_position_X', 'world_position_Y']].to_numpy()[::step]
+
+    return json.dumps({
+        'type': 'session',
+        'clock': clock_name,
+        'fields': [name for name, _, _ in HUD_FIELDS],
+        'scales': [scale for _, _, scale in HUD_FIELDS],
+        'n_frames': int(len(df)),
+        'max_deg': float(config.MAX_DEG),
+        'lean_low_deg': float(config.LEAN_LOW_DEG),
+        'lean_high_deg': float(config.LEAN_HIGH_DEG),
+        'track': np.round(track, 2).tolist(),
+    })
+
+# ----------------------------
+# WebSocket framing
+# ----------------------------
+def ws_frame(opcode, payload):
+    head = bytearray([0x80 | opcode])
+    n = len(payload)
+    if n < 126:
+        head.append(n)
+    elif n < (1 << 16):
+        head.append(126); head += struct.pack('>H', n)
+    else:
+        head.append(127); head += struct.pack('>Q', n)
+    return bytes(head) + payload
+
+async def read_ws_frame(reader):
+    b0, b1 = await reader.readexactly(2)
+    opcode = b0 & 0x0F
+    n = b1 & 0x7F
+    if n == 126:
+        n, = struct.unpack('>H', await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack('>Q', await reader.readexactly(8))
+    if n > MAX_INBOUND:
+        raise ValueError(f"Inbound frame too large ({n} bytes)")
+
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[k % 4] for k, b in enumerate(payload))
+    return opcode, payload
+
+# ----------------------------
+# Playback
+# ----------------------------
+class PlaybackClock:
+    """Session time shared by every client watching the same clock.
+
+    The clock loops over the session and pushes the current frame index to
+    its clients at STREAM_FPS. Any of its viewers can pause, seek or change
+    the rate, and the change is broadcast to all of them. Deltas are cached
+    per tick, so clients that are in step share one encoded message.
+    """
+
+    def __init__(self, name, states, time_s):
+        self.name = name
+        self.states = states
+        self.time_s = time_s
+        self.span = max(float(time_s[-1]), 1e-9)
+        self.clients = set()
+        self.index = 0
+        self.task = None
+        self.rate = 1.0
+        self.paused = False
+        self._anchor_t = 0.0
+        self._anchor_wall = time.monotonic()
+        self._encoded = {}
+
+    def session_time(self):
+        if self.paused:
+            return self._anchor_t
+        return (self._anchor_t + (time.monotonic() - self._anchor_wall) * self.rate) % self.span
+
+    def seek(self, t_s):
+        if not np.isfinite(float(t_s)):
+            return
+        self._anchor_t = float(t_s) % self.span
+        self._anchor_wall = time.monotonic()
+
+    def pause(self):
+        self.seek(self.session_time())
+        self.paused = True
+
+    def play(self):
+        # Re-anchoring a running clock would rewind it to the last anchor
+        if not self.paused:
+            return
+        self._anchor_wall = time.monotonic()
+        self.paused = False
+
+    def set_rate(self, rate):
+        if not np.isfinite(float(rate)):
+            return
+        self.seek(self.session_time())
+        self.rate = min(max(float(rate), 0.0), float(config.STREAM_MAX_RATE))
+
+    def control(self, msg):
+        # Text command from a viewer, e.g. {"cmd": "seek", "t": 60}
+        cmd = msg.get('cmd')
+        if cmd == 'pause':
+            self.pause()
+        elif cmd == 'play':
+            self.play()
+        elif cmd == 'seek':
+            self.seek(msg['t'])
+        elif cmd == 'skip':
+            self.seek(self.session_time() + float(msg['dt']))
+        elif cmd == 'rate':
+            self.set_rate(msg['rate'])
+        else:
+            return
+        self.broadcast_state()
+
+    def state_message(self):
+        # Text frame with the shared playback state, viewers show and build on it
+        return ws_frame(OP_TEXT, json.dumps({
+            'type': 'clock', 'paused': self.paused, 'rate': self.rate
+        }).encode())
+
+    def broadcast_state(self):
+        message = self.state_message()
+        for client in self.clients:
+            client.writer.write(message)
+
+    def encoded(self, last_index):
+        # Message taking a client from last_index to the current frame
+        key = (last_index, self.index)
+        if key not in self._encoded:
+            prev = None if last_index is None else self.states[last_index]
+            self._encoded[key] = ws_frame(OP_BINARY, encode_frame(self.index, self.states[self.index], prev))
+        return self._encoded[key]
+
+    async def run(self):
+        period = 1.0 / float(config.STREAM_FPS)
+        while True:
+            i = int(np.searchsorted(self.time_s, self.session_time(), side = 'right')) - 1
+            i = min(max(i, 0), len(self.states) - 1)
+            if i != self.index:
+                self.index = i
+                self._encoded = {}
+                for client in self.clients:
+                    client.notify()
+            await asyncio.sleep(period)
+
+class Client:
+    """One browser connection with a single slot for the newest frame.
+
+    The page acks every binary frame. At most STREAM_IN_FLIGHT frames may be
+    unacked; frames produced beyond that are skipped, so a slow viewer jumps
+    to the newest frame instead of working through a backlog.
+    """
+
+    def __init__(self, writer, clock):
+        self.writer = writer
+        self.clock = clock
+        self.last_index = None
+        self.in_flight = 0
+        self.dropped = 0
+        self._wake = asyncio.Event()
+
+    def notify(self):
+        if self._wake.is_set() or self.in_flight >= int(config.STREAM_IN_FLIGHT):
+            self.dropped += 1
+        self._wake.set()
+
+    def ack(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake.set()
+
+    async def send_loop(self):
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                index = self.clock.index
+                if index == self.last_index or self.in_flight >= int(config.STREAM_IN_FLIGHT):
+                    continue
+                self.writer.write(self.clock.encoded(self.last_index))
+                self.last_index = index
+                self.in_flight += 1
+                # Write buffer limit is 0, so this waits until the frame is flushed
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+
+async def read_loop(reader, writer, client):
+    # Acks, clock commands and control frames, returns when the client goes away
+    while True:
+        opcode, payload = await read_ws_frame(reader)
+        if opcode == OP_CLOSE:
+            writer.write(ws_frame(OP_CLOSE, payload[:2]))
+            return
+        if opcode == OP_PING:
+            writer.write(ws_frame(OP_PONG, payload))
+        elif opcode == OP_BINARY:
+            client.ack()
+        elif opcode == OP_TEXT:
+            try:
+                client.clock.control(json.loads(payload))
+            except (ValueError, KeyError, TypeError, AttributeError):
+                pass
+
+# ----------------------------
+# Server
+# ----------------------------
+class StreamServer:
+    """Serves the HUD state over WebSocket, plus the HTML client on '/'.
+
+    Clients connect to /ws or /ws/<clock>. Each clock name gets its own
+    playback clock, created on first use and dropped when its last viewer
+    leaves; all clocks share the precomputed states.
+    """
+
+    def __init__(self, session):
+        df = session.to_frame()
+        self.df = df
+        self.states = quantize(df)
+        self.time_s = df['time_s'].to_numpy()
+        self.clocks = {}
+
+    def join(self, name, client_writer):
+        if name not in self.clocks:
+            clock = PlaybackClock(name, self.states, self.time_s)
+            clock.task = asyncio.get_running_loop().create_task(clock.run())
+            self.clocks[name] = clock
+        clock = self.clocks[name]
+        client = Client(client_writer, clock)
+        clock.clients.add(client)
+        return client
+
+    def leave(self, client):
+        clock = client.clock
+        clock.clients.discard(client)
+        if not clock.clients and self.clocks.get(clock.name) is clock:
+            clock.task.cancel()
+            del self.clocks[clock.name]
+
+    def same_origin(self, writer, origin):
+        # Browsers always send Origin, only accept pages served by this server
+        if origin is None:
+            return True
+        host, port = writer.get_extra_info('sockname')[:2]
+        hosts = {config.STREAM_HOST, host}
+        try:
+            if ipaddress.ip_address(host).is_loopback:
+                hosts |= {'localhost', '127.0.0.1', '::1'}
+        except ValueError:
+            pass
+        allowed = {f"[{h}]:{port}" if ':' in h else f"{h}:{port}" for h in hosts}
+        return urlsplit(origin).netloc.lower() in allowed
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            lines = request.decode('latin-1').split('\r\n')
+            method, target, _ = lines[0].split(' ', 2)
+            headers = {}
+            for line in lines[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+            path = urlsplit(target).path
+
+            if headers.get('upgrade', '').lower() == 'websocket':
+                name = None
+                if path == '/ws' or path == '/ws/':
+                    name = config.STREAM_CLOCK
+                elif path.startswith('/ws/') and '/' not in path[len('/ws/'):]:
+                    name = path[len('/ws/'):]
+
+                connection = [t.strip().lower() for t in headers.get('connection', '').split(',')]
+                if name is None:
+                    writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                elif not self.same_origin(writer, headers.get('origin')):
+                    # Stops other web pages in the viewer's browser from reaching the stream
+                    writer.write(b'HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                elif (method != 'GET' or 'upgrade' not in connection
+                        or not headers.get('sec-websocket-key')
+                        or headers.get('sec-websocket-version') != '13'):
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nSec-WebSocket-Version: 13\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                else:
+                    await self.serve_ws(reader, writer, headers, name)
+            elif method == 'GET' and path in ('/', '/index.html'):
+                with open(CLIENT_HTML, 'rb') as f:
+                    body = f.read()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n'
+                    + f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+                )
+            else:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_ws(self, reader, writer, headers, name):
+        key = headers['sec-websocket-key'].encode()
+        accept = base64.b64encode(hashlib.sha1(key + WS_GUID).digest()).decode()
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+        ).encode())
+        # Small kernel buffer and no asyncio buffering, drain() then waits per frame
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(config.STREAM_SEND_BUFFER))
+        writer.transport.set_write_buffer_limits(high = 0)
+        writer.write(ws_frame(OP_TEXT, session_info(self.df, name).encode()))
+
+        client = self.join(name, writer)
+        writer.write(client.clock.state_message())
+        client.notify()
+        sender = asyncio.get_running_loop().create_task(client.send_loop())
+        try:
+            await read_loop(reader, writer, client)
+        finally:
+            self.leave(client)
+            sender.cancel()
+            print(f"Viewer left clock '{name}', {client.dropped} frames skipped")
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Streaming on http://{host}:{port}/")
+        async with server:
+            await server.serve_forever()
+
+def main():
+    session = data_load.load_session()
+    if session is None:
+        return
+    server = StreamServer(session)
+    try:
+        asyncio.run(server.serve(config.STREAM_HOST, config.STREAM_PORT))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+from motogp_dashboard import config
+from motogp_dashboard import graphics
+
+class TimelineStrip:
+    """Whole session strip of speed, throttle, brake and lean with a seekable cursor.
+
+    Lines are drawn from each channel's min/max pyramid, so a redraw costs
+    about two points per pixel whatever the session length or zoom level.
+    Drag on the strip to seek, scroll over it to zoom.
+    """
+
+    def __init__(self, fig, playhead):
+        self.fig = fig
+        self.playhead = playhead
+        self.session = None
+        self.t = None
+        self.zoomed = False
+        self.dragging = False
+        self.dirty = False
+        # Playback animation, set once it exists so its blit background can be dropped
+        self.animation = None
+
+        self.ax = fig.add_axes(config.TIMELINE_AX_POS, zorder = 0.40)
+        self.ax.set_facecolor((1, 1, 1, 0))
+        self.ax.tick_params(left = False, labelleft = False, labelsize = config.TIMELINE_FONT_SIZE)
+        for name, spine in self.ax.spines.items():
+            spine.set_visible(name == 'bottom')
+
+        # (column, label, colour), top lane first
+        self.lanes = (
+            ('speed_kph',       'Speed', config.TIMELINE_SPEED_COLOR),
+            ('throttle_smooth', 'Thr',   config.THROTTLE_COLOR),
+            ('brake_smooth',    'Brk',   config.BRAKE_COLOR),
+            ('lean_deg_signed', 'Lean',  config.TIMELINE_LEAN_COLOR),
+        )
+        n = len(self.lanes)
+        self.ax.set_ylim(0, n)
+
+        self.lines = {}
+        for k, (col, label, colour) in enumerate(self.lanes):
+            line, = self.ax.plot([], [], color = colour, linewidth = config.TIMELINE_LINEWIDTH, zorder = 1)
+            self.lines[col] = line
+            self.ax.text(
+                -0.005, n - k - 0.5, label, transform = self.ax.get_yaxis_transform(),
+                ha = 'right', va = 'center', color = colour,
+                fontproperties = graphics.get_font(config.TIMELINE_FONT_SIZE)
+            )
+
+        self.cursor = self.ax.axvline(0.0, color = config.TIMELINE_CURSOR_COLOR, linewidth = 1.2, zorder = 2)
+
+        fig.canvas.mpl_connect('button_press_event', self.on_press)
+        fig.canvas.mpl_connect('motion_notify_event', self.on_motion)
+        fig.canvas.mpl_connect('button_release_event', self.on_release)
+        fig.canvas.mpl_connect('scroll_event', self.on_scroll)
+        fig.canvas.mpl_connect('resize_event', self.on_resize)
+        fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def set_session(self, session):
+        if session is self.session:
+            return
+        self.session = session
+        self.t = session.to_frame()['time_s'].to_numpy()
+        if not self.zoomed:
+            self.ax.set_xlim(0.0, self.t_end())
+        self.refresh()
+
+    def t_end(self):
+        return max(float(self.t[-1]), float(config.TIMELINE_MIN_SPAN_S))
+
+    def set_playhead(self, t_s):
+        self.cursor.set_xdata([t_s, t_s])
+
+    def lane_values(self, k, col, vals, pyramid):
+        # Scale a channel into its own lane, lane 0 is the top one
+        if col == 'lean_deg_signed':
+            norm = 0.5 + 0.5 * vals / float(config.MAX_DEG)
+        elif col == 'speed_kph':
+            norm = vals / max(pyramid.vmax, 1e-9)
+        else:
+            norm = vals
+        pad = float(config.TIMELINE_LANE_PAD)
+        base = len(self.lanes) - 1 - k
+        return base + pad + (1.0 - 2.0 * pad) * np.clip(norm, 0.0, 1.0)
+
+    def refresh(self):
+        if self.session is None:
+            return
+        t0, t1 = self.ax.get_xlim()
+        i0 = int(np.searchsorted(self.t, t0, side = 'left'))
+        i1 = int(np.searchsorted(self.t, t1, side = 'right'))
+        n_px = int(self.ax.bbox.width)
+
+        pyramids = self.session.pyramids
+        for k, (col, _, _) in enumerate(self.lanes):
+            idx, vals = pyramids[col].query(max(i0 - 1, 0), i1 + 1, n_px)
+            self.lines[col].set_data(self.t[idx], self.lane_values(k, col, vals, pyramids[col]))
+
+        # The lines are part of the blit background, redraw it once the loop is idle
+        self.dirty = True
+        self.fig.canvas.draw_idle()
+
+    def on_draw(self, event):
+        # Background now holds the new lines, make the animation recapture it
+        if not self.dirty:
+            return
+        self.dirty = False
+        if self.animation is not None:
+            getattr(self.animation, '_blit_cache', {}).pop(self.ax, None)
+
+    # Mouse handling
+    def on_press(self, event):
+        if event.inaxes is not self.ax or event.button != 1 or self.session is None:
+            return
+        self.dragging = True
+        self.playhead.seek(event.xdata)
+
+    def on_motion(self, event):
+        if self.dragging and event.inaxes is self.ax and event.xdata is not None:
+            self.playhead.seek(event.xdata)
+
+    def on_release(self, event):
+        self.dragging = False
+
+    def on_resize(self, event):
+        # Pixel width changed, redecimate for the new size
+        self.refresh()
+
+    def on_scroll(self, event):
+        if event.inaxes is not self.ax or self.session is None:
+            return
+        t0, t1 = self.ax.get_xlim()
+        full = self.t_end()
+        step = float(config.TIMELINE_ZOOM_STEP)
+        span = (t1 - t0) / step if event.button == 'up' else (t1 - t0) * step
+        span = min(max(span, float(config.TIMELINE_MIN_SPAN_S)), full)
+
+        # Zoom around the mouse, keeping it over the same time
+        rel = (event.xdata - t0) / (t1 - t0)
+        new_t0 = min(max(event.xdata - rel * span, 0.0), full - span)
+        self.ax.set_xlim(new_t0, new_t0 + span)
+        self.zoomed = span < full
+        self.refresh()
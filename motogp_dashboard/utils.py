@@ -28,3 +28,47 @@ def smooth_and_limit(series, dt, alpha, rate_up, rate_down):
     return np.clip(out, 0.0, 1.0)
 
 
+
+class MinMaxPyramid:
+    """Min/max decimation pyramid over a 1D signal.
+
+    Level k holds the min and max of every 2**k consecutive samples, so any
+    index range can be drawn from the coarsest level that still gives one
+    bucket per pixel, i.e. at most 2 points per pixel.
+    """
+
+    def __init__(self, values):
+        vals = np.asarray(values, dtype = float)
+        vals = np.nan_to_num(vals, nan = 0.0)
+        self.n = len(vals)
+        self.mins = [vals]
+        self.maxs = [vals]
+        while len(self.mins[-1]) > 1:
+            lo = self.mins[-1]; hi = self.maxs[-1]
+            if len(lo) % 2:
+                lo = np.append(lo, lo[-1]); hi = np.append(hi, hi[-1])
+            self.mins.append(np.minimum(lo[0::2], lo[1::2]))
+            self.maxs.append(np.maximum(hi[0::2], hi[1::2]))
+        self.vmin = float(self.mins[-1][0]) if self.n else 0.0
+        self.vmax = float(self.maxs[-1][0]) if self.n else 0.0
+
+    def query(self, i0, i1, n_px):
+        # Sample indices and values covering [i0, i1) in at most ~2 * n_px points
+        i0 = max(0, int(i0)); i1 = min(self.n, int(i1))
+        n_px = max(1, int(n_px))
+        if i1 <= i0:
+            return np.empty(0, dtype = int), np.empty(0)
+
+        level = 0
+        while (i1 - i0) > (n_px << level) and level < len(self.mins) - 1:
+            level += 1
+
+        if level == 0:
+            idx = np.arange(i0, i1)
+            return idx, self.mins[0][i0:i1]
+
+        b0 = i0 >> level
+        b1 = min(-(-i1 >> level), len(self.mins[level]))
+        idx = np.minimum(np.arange(b0, b1) << level, self.n - 1)
+        # Interleave min and max so each bucket draws as a vertical stroke
+        return np.repeat(idx, 2), np.column_stack((self.mins[level][b0:b1], self.maxs[level][b0:b1])).ravel()